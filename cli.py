@@ -0,0 +1,101 @@
+import argparse
+from image_hash import add_dedupe_arguments, duplicate_index_from_args
+
+# Subcommand handlers import their script only when run, so `--help` and
+# light subcommands never load cv2, av, numpy, PIL or openai.
+
+def run_md(args):
+    from image2md import image_to_markdown
+    # One index for the whole batch so later images can reuse earlier results
+    duplicates = duplicate_index_from_args(args)
+    try:
+        for image_path in args.image_paths:
+            print(image_to_markdown(image_path, tile=args.tile, tile_size=args.tile_size, overlap=args.overlap,
+                                    max_workers=args.max_workers, duplicates=duplicates))
+    finally:
+        if args.dedupe_index:
+            duplicates.save(args.dedupe_index)
+
+def run_csv(args):
+    from image2csv import image_to_markdown
+    duplicates = duplicate_index_from_args(args)
+    try:
+        for image_path in args.image_paths:
+            print(image_to_markdown(image_path, tile=args.tile, tile_size=args.tile_size, overlap=args.overlap,
+                                    max_workers=args.max_workers, columnar=args.columnar, duplicates=duplicates))
+    finally:
+        if args.dedupe_index:
+            duplicates.save(args.dedupe_index)
+
+def run_all(args):
+    from image2all import analyze_image
+    for image_path in args.image_paths:
+        print(analyze_image(image_path, columnar=args.columnar))
+
+def run_gen(args):
+    from gen_image import generate_image
+    image_path = generate_image(args.prompt, size=args.size, model=args.model)
+    if image_path is None:
+        raise SystemExit(1)
+    print(f"Image generated and saved to: {image_path}")
+
+def run_video(args):
+    from video_segmentation_combined import process_video
+    result = process_video(args.input_path, args.output_path, method=args.method, target_fps=args.target_fps,
+                           max_frames=args.max_frames, inference_size=args.inference_size, refine=args.refine,
+                           compact=args.compact, dry_run=args.dry_run)
+    if args.dry_run:
+        from dry_run import print_plan
+        print_plan(result)
+
+def add_tiling_arguments(parser):
+    parser.add_argument("--tile", action="store_true", help="Split tall images into overlapping horizontal strips")
+    parser.add_argument("--tile-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--max-workers", type=int, default=4)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Vision model tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    md_parser = subparsers.add_parser("md", help="Convert images to markdown")
+    md_parser.add_argument("image_paths", nargs="+")
+    add_tiling_arguments(md_parser)
+    add_dedupe_arguments(md_parser)
+    md_parser.set_defaults(func=run_md)
+
+    csv_parser = subparsers.add_parser("csv", help="Extract tables from images as csv")
+    csv_parser.add_argument("image_paths", nargs="+")
+    add_tiling_arguments(csv_parser)
+    add_dedupe_arguments(csv_parser)
+    csv_parser.add_argument("--columnar", action="store_true", help="Also write typed Parquet output")
+    csv_parser.set_defaults(func=run_csv)
+
+    all_parser = subparsers.add_parser("all", help="Markdown, csv and summary in one request per image")
+    all_parser.add_argument("image_paths", nargs="+")
+    all_parser.add_argument("--columnar", action="store_true", help="Also write typed Parquet output")
+    all_parser.set_defaults(func=run_all)
+
+    gen_parser = subparsers.add_parser("gen", help="Generate an image from a prompt")
+    gen_parser.add_argument("prompt")
+    gen_parser.add_argument("--size", default="1024x1024")
+    gen_parser.add_argument("--model", help="Model to use (default: routed)")
+    gen_parser.set_defaults(func=run_gen)
+
+    video_parser = subparsers.add_parser("video", help="Segment colored objects in a video")
+    video_parser.add_argument("input_path")
+    video_parser.add_argument("output_path")
+    video_parser.add_argument("--method", choices=["bounding_boxes", "direct_image"], default="bounding_boxes")
+    video_parser.add_argument("--target-fps", type=float, default=15)
+    video_parser.add_argument("--max-frames", type=int, default=100)
+    video_parser.add_argument("--inference-size", type=int, help="Longest side of the frame copy sent to the model")
+    video_parser.add_argument("--refine", action="store_true", help="Refine small or uncertain detections on crops")
+    video_parser.add_argument("--compact", action="store_true", help="Use the compact detection format to cut output tokens")
+    video_parser.add_argument("--dry-run", action="store_true", help="Only estimate the cost of the job")
+    video_parser.set_defaults(func=run_video)
+
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
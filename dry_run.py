@@ -0,0 +1,219 @@
+import os
+import json
+import math
+import sqlite3
+import argparse
+import statistics
+from pathlib import Path
+
+# Fallback seconds per model call when nothing has been measured yet
+DEFAULT_CALL_LATENCY = 3.0
+# Typical JPEG size per pixel for video frames, used when a frame cannot be sampled
+JPEG_BYTES_PER_PIXEL = 0.15
+# Matches max_tokens in the image and video scripts
+MAX_OUTPUT_TOKENS = 1000
+# process_video sleeps this long after each frame to avoid rate limiting
+FRAME_DELAY = 0.5
+# Rough prompt size; prompts in this repo are a few hundred characters
+PROMPT_TOKENS = 80
+
+def image_tokens(width, height):
+    """
+    Approximate Gemini input tokens for an image.
+
+    Images up to 384x384 cost 258 tokens; larger images are split into
+    768x768 tiles of 258 tokens each.
+    """
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+def base64_size(num_bytes):
+    return 4 * math.ceil(num_bytes / 3)
+
+def count_tiles(width, height, tile_size=800, overlap=100):
+    """Number of strips split_image_into_tiles in image2md produces; only the height is split."""
+    if height <= tile_size:
+        return 1
+    return 1 + math.ceil((height - tile_size) / max(1, tile_size - overlap))
+
+def measured_latency(job_kinds=("image2md", "image2csv"), queue_db="jobs.sqlite3"):
+    """
+    Return (seconds per call, source) measured on the same kind of call.
+
+    Uses the median duration of recent untiled job_kinds jobs in the job
+    queue, each of which is a single model call, and DEFAULT_CALL_LATENCY
+    when there are none. The model router's latencies are not used because
+    they mix every kind of call made in the process. Video detection calls
+    have no per-call history (the queue only records whole videos), so with
+    job_kinds empty DEFAULT_CALL_LATENCY is returned.
+    """
+    if not job_kinds:
+        return DEFAULT_CALL_LATENCY, "default"
+
+    if Path(queue_db).exists():
+        conn = sqlite3.connect(queue_db)
+        rows = conn.execute(
+            "SELECT params, julianday(finished_at) - julianday(started_at) FROM jobs "
+            f"WHERE status = 'done' AND kind IN ({', '.join('?' for _ in job_kinds)}) "
+            "ORDER BY id DESC LIMIT 500",
+            list(job_kinds),
+        ).fetchall()
+        conn.close()
+        # Tiled jobs make several calls, so their duration is not a per-call latency
+        durations = [days * 86400 for params, days in rows
+                     if days is not None and days > 0 and not json.loads(params).get("tile")][:100]
+        if durations:
+            return statistics.median(durations), "job queue history"
+
+    return DEFAULT_CALL_LATENCY, "default"
+
+def plan_images(image_paths, tile=False, tile_size=800, overlap=100, max_workers=4, calls_per_image=1,
+                latency=None):
+    """
+    Estimate calls, upload bytes, tokens and wall time for image2md/image2csv over a batch.
+
+    calls_per_image is 2 when running both image2md and image2csv, 1 for image2all.
+    """
+    import PIL.Image
+
+    if latency is None:
+        latency, latency_source = measured_latency()
+    else:
+        latency_source = "given"
+
+    calls = upload_bytes = input_tokens = 0
+    wall_time = 0.0
+    for image_path in image_paths:
+        # Opening reads only the header, not the pixel data
+        with PIL.Image.open(image_path) as image:
+            width, height = image.size
+
+        tiles = count_tiles(width, height, tile_size, overlap) if tile else 1
+        if tiles > 1:
+            # Tiles are re-encoded as JPEG, overlap is uploaded twice
+            tile_w, tile_h = width, tile_size
+            per_call_bytes = base64_size(int(tile_w * tile_h * JPEG_BYTES_PER_PIXEL))
+            per_call_tokens = image_tokens(tile_w, tile_h)
+            rounds = math.ceil(tiles / max_workers)
+        else:
+            # The file is uploaded as-is
+            per_call_bytes = base64_size(os.path.getsize(image_path))
+            per_call_tokens = image_tokens(width, height)
+            rounds = 1
+
+        calls += tiles * calls_per_image
+        upload_bytes += per_call_bytes * tiles * calls_per_image
+        input_tokens += (per_call_tokens + PROMPT_TOKENS) * tiles * calls_per_image
+        wall_time += rounds * calls_per_image * latency
+
+    return {
+        "images": len(image_paths),
+        "api_calls": calls,
+        "upload_bytes": upload_bytes,
+        "input_tokens": input_tokens,
+        "max_output_tokens": calls * MAX_OUTPUT_TOKENS,
+        "latency_per_call": latency,
+        "latency_source": latency_source,
+        "wall_time_seconds": wall_time,
+    }
+
+def plan_video(input_path, target_fps=15, max_frames=100, inference_size=None, refine=False,
+               max_refinements=4, latency=None):
+    """
+    Estimate calls, upload bytes, tokens and wall time for process_video in
+    video_segmentation_combined.py with the same sampling settings.
+
+    With refine=True the estimate is an upper bound that assumes every frame
+    uses all max_refinements crop calls.
+    """
+    import cv2
+
+    if latency is None:
+        latency, latency_source = measured_latency(job_kinds=())
+    else:
+        latency_source = "given"
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {input_path}")
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Same sampling as process_video
+    frame_sampling_rate = max(1, round(original_fps / target_fps))
+    frames_read = min(max_frames, total_frames) if total_frames > 0 else max_frames
+    sampled_frames = math.ceil(frames_read / frame_sampling_rate)
+
+    # Size of the copy sent to the model
+    scale = 1.0
+    if inference_size and max(width, height) > inference_size:
+        scale = inference_size / max(width, height)
+    send_w, send_h = round(width * scale), round(height * scale)
+
+    # Measure the JPEG size of the first frame, falling back to a typical ratio
+    ret, frame = cap.read()
+    cap.release()
+    if ret:
+        frame = cv2.resize(frame, (send_w, send_h), interpolation=cv2.INTER_AREA) if scale < 1 else frame
+        frame_bytes = len(cv2.imencode(".jpg", frame)[1])
+    else:
+        frame_bytes = int(send_w * send_h * JPEG_BYTES_PER_PIXEL)
+
+    calls_per_frame = 1 + (max_refinements if refine else 0)
+    calls = sampled_frames * calls_per_frame
+    # Crops are usually much smaller than the frame; count them at full frame size as an upper bound
+    upload_bytes = calls * base64_size(frame_bytes)
+    input_tokens = calls * (image_tokens(send_w, send_h) + PROMPT_TOKENS)
+
+    return {
+        "video": f"{width}x{height}, {original_fps:.2f} FPS, {total_frames} frames",
+        "inference_resolution": f"{send_w}x{send_h}",
+        "sampled_frames": sampled_frames,
+        "api_calls": calls,
+        "upload_bytes": upload_bytes,
+        "input_tokens": input_tokens,
+        "max_output_tokens": calls * MAX_OUTPUT_TOKENS,
+        "latency_per_call": latency,
+        "latency_source": latency_source,
+        "wall_time_seconds": calls * latency + sampled_frames * FRAME_DELAY,
+    }
+
+def print_plan(plan):
+    for key, value in plan.items():
+        if key == "upload_bytes":
+            value = f"{value / 1_000_000:.2f} MB"
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key.replace('_', ' ')}: {value}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the cost of a job without calling the model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    video_parser = subparsers.add_parser("video", help="Plan process_video")
+    video_parser.add_argument("input_path")
+    video_parser.add_argument("--target-fps", type=float, default=15)
+    video_parser.add_argument("--max-frames", type=int, default=100)
+    video_parser.add_argument("--inference-size", type=int)
+    video_parser.add_argument("--refine", action="store_true")
+    video_parser.add_argument("--latency", type=float, help="Seconds per call (default: measured)")
+
+    images_parser = subparsers.add_parser("images", help="Plan image2md/image2csv over images")
+    images_parser.add_argument("image_paths", nargs="+")
+    images_parser.add_argument("--tile", action="store_true")
+    images_parser.add_argument("--tile-size", type=int, default=800)
+    images_parser.add_argument("--overlap", type=int, default=100)
+    images_parser.add_argument("--max-workers", type=int, default=4)
+    images_parser.add_argument("--calls-per-image", type=int, default=1)
+    images_parser.add_argument("--latency", type=float, help="Seconds per call (default: measured)")
+
+    args = parser.parse_args()
+    if args.command == "video":
+        print_plan(plan_video(args.input_path, args.target_fps, args.max_frames, args.inference_size,
+                              args.refine, latency=args.latency))
+    else:
+        print_plan(plan_images(args.image_paths, args.tile, args.tile_size, args.overlap, args.max_workers,
+                               args.calls_per_image, latency=args.latency))
@@ -1,39 +1,35 @@
-import os
-from openai import OpenAI
+from llm_client import get_client
+from model_router import image_router
 import base64
 from io import BytesIO
 from pathlib import Path
 import datetime
-from PIL import Image
 
-# Initialize OpenAI client
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
-# Create images directory if it doesn't exist
+# Generated images directory, created on first save
 IMAGES_DIR = Path("generated_images")
-IMAGES_DIR.mkdir(exist_ok=True)
 
-def generate_image(prompt, size="1024x1024", model="imagen-3.0-fast-generate-001"):
+def generate_image(prompt, size="1024x1024", model=None, min_quality=1):
     """
     Generate an image based on a text prompt using an AI model.
     
     Args:
         prompt (str): The text description of the image to generate
         size (str): Image size (default: "1024x1024")
-        model (str): The model to use (default: "dall-e-3")
+        model (str): The model to use (default: None, route to the fastest healthy model)
+        min_quality (int): Minimum quality tier when routing (see model_router.IMAGE_MODELS)
         
     Returns:
         Path: Path to the saved image file
     """
+    from PIL import Image
+    
     try:
         # Call the API to generate the image
-        response = client.images.generate(
-            model=model,
-            prompt=prompt,
-            size=size,
-            n=1,
-            response_format="b64_json"
-        )
+        request = dict(prompt=prompt, size=size, n=1, response_format="b64_json")
+        if model:
+            response = get_client().images.generate(model=model, **request)
+        else:
+            response = image_router.generate_image(get_client(), min_quality=min_quality, **request)
         
         # Get the base64 encoded image data
         image_data = response.data[0].b64_json
@@ -49,6 +45,7 @@ def generate_image(prompt, size="1024x1024", model="imagen-3.0-fast-generate-001
         filename = f"{safe_prompt}_{timestamp}.png"
         
         # Save the image
+        IMAGES_DIR.mkdir(exist_ok=True)
         image_path = IMAGES_DIR / filename
         image.save(image_path)
         
@@ -0,0 +1,99 @@
+import re
+from model_router import vision_router
+from llm_client import get_client
+from image2md import encode_image_to_base64, save_markdown, strip_code_fence
+from image2csv import save_csv, parse_csv_table, save_parquet, append_to_dataset
+
+# One request returns all outputs, separated by these section markers
+SECTIONS = ["MARKDOWN", "CSV", "SUMMARY"]
+
+COMBINED_PROMPT = (
+    "Please analyze this image and return three sections, each starting with its marker line exactly as shown.\n"
+    "=== MARKDOWN ===\n"
+    "Convert the contents of the image into well-formatted markdown. Include all relevant details and maintain a clear structure.\n"
+    "=== CSV ===\n"
+    "Extract the tables from the image as csv. Only output the csv. Make sure to extract numbers properly, if there are abbreviations like M, B, K, etc, convert them to the actual number. If any commas are present between numbers, remove them. Leave this section empty if there are no tables.\n"
+    "=== SUMMARY ===\n"
+    "Summarize the image in two or three sentences."
+)
+
+def split_sections(content):
+    """Split a combined response into a dict of section name -> text."""
+    pattern = r"^=+\s*(" + "|".join(SECTIONS) + r")\s*=+\s*$"
+    parts = re.split(pattern, content, flags=re.MULTILINE)
+
+    # parts is [preamble, name, text, name, text, ...]
+    sections = {name: "" for name in SECTIONS}
+    for name, text in zip(parts[1::2], parts[2::2]):
+        sections[name] = strip_code_fence(text).strip()
+    return sections
+
+def analyze_image(image_path, columnar=False):
+    """
+    Produce markdown, csv and a summary for an image with a single model call.
+
+    The image is encoded and uploaded once. The markdown and csv are saved to
+    md_results exactly as image2md.py and image2csv.py would save them, and
+    the summary is saved as a markdown result of kind "summary".
+
+    Args:
+        image_path (str): Path to the image
+        columnar (bool): Also write typed Parquet output and append it to the shared dataset
+    """
+    try:
+        # Convert the image to base64
+        base64_image = encode_image_to_base64(image_path)
+
+        # Create the message with the image
+        response = vision_router.chat_completion(
+            get_client(),
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": COMBINED_PROMPT
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    ]
+                }
+            ],
+            # Room for both the markdown and csv outputs
+            max_tokens=2000
+        )
+
+        sections = split_sections(response.choices[0].message.content)
+        model = response.model
+        if not sections["MARKDOWN"]:
+            raise ValueError("Response has no MARKDOWN section")
+        results = []
+
+        markdown_path = save_markdown(sections["MARKDOWN"], image_path, prompt=COMBINED_PROMPT, model=model)
+        results.append(f"Markdown saved to: {markdown_path}")
+
+        if sections["CSV"]:
+            csv_content = sections["CSV"] + "\n"
+            csv_path = save_csv(csv_content, image_path, prompt=COMBINED_PROMPT, model=model)
+            results.append(f"CSV saved to: {csv_path}")
+            if columnar:
+                table = parse_csv_table(csv_content)
+                results.append(f"Parquet saved to: {save_parquet(table, image_path, prompt=COMBINED_PROMPT, model=model)}")
+                results.append(f"Appended to dataset: {append_to_dataset(table, image_path)}")
+
+        summary_path = save_markdown(sections["SUMMARY"], image_path, prompt=COMBINED_PROMPT, model=model, kind="summary")
+        results.append(f"Summary saved to: {summary_path}")
+
+        return "\n".join(results) + f"\n\nSummary:\n{sections['SUMMARY']}"
+
+    except Exception as e:
+        return f"Error processing image: {str(e)}\nType: {type(e)}"
+
+# Example usage
+if __name__ == "__main__":
+    image_path = "images/dd_all_sources.png"  # Replace with your image path
+    result = analyze_image(image_path)
+    print(result)
@@ -1,74 +1,295 @@
-import os
-from openai import OpenAI
-import PIL.Image
-import base64
-from io import BytesIO
+from image2md import encode_image_to_base64, encode_pil_image_to_base64, split_image_into_tiles, request_markdown
+from result_store import ResultStore
 from pathlib import Path
 import datetime
+import csv
+import uuid
+from decimal import Decimal, InvalidOperation
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize OpenAI client
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
-# Create md_results directory if it doesn't exist
+# Results directory, created on first save
 RESULTS_DIR = Path("md_results")
-RESULTS_DIR.mkdir(exist_ok=True)
 
-def encode_image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Index of saved results keyed by source image hash, prompt and model
+store = ResultStore(RESULTS_DIR)
+
+# Append-only Parquet dataset shared by every extracted table
+DATASET_DIR = RESULTS_DIR / "dataset"
+
+# Range of values an int64 column can hold
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+# Multipliers for abbreviated numbers such as 54.49M
+NUMBER_SUFFIXES = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000, "T": 1_000_000_000_000}
+
+CSV_PROMPT = "Please analyze this image and extract tables from it and make it into a csv file. Only output the csv file. Make sure to extract numbers properly, if there are abbreviations like M, B, K, etc, convert them to the actual number. If any commas are present between numbers, remove them."
+TILE_PROMPT = CSV_PROMPT + " This image is one slice of a larger table, so rows may be cut off at the edges. Always include the header row."
 
-def save_csv(content, original_image_path):
-    # Get the original image filename without extension
+def extract_csv(content):
+    """Extract the csv text between ```csv and ``` from a model response."""
+    # extract the csv content from the response by getting the text between ```csv and ```
+    # remove the first line of the csv content
+    csv_content = content.split("```csv")[1].split("```")[0]
+    csv_content = csv_content.split("\n")[1:]
+    return "\n".join(csv_content)
+
+def stitch_csv_tiles(tile_contents):
+    """
+    Join the csv extracted from neighbouring tiles into one table.
+    
+    The header row is kept once. The longest run of rows at the start of a tile
+    that repeats the last rows of the previous tile comes from the overlap
+    region and is dropped; repeated rows elsewhere are kept.
+    """
+    header = None
+    rows = []
+    previous_rows = []
+    
+    for content in tile_contents:
+        lines = [line for line in content.split("\n") if line.strip()]
+        if not lines:
+            previous_rows = []
+            continue
+        if header is None:
+            header = lines[0]
+        if lines[0].strip() == header.strip():
+            lines = lines[1:]
+        
+        tile_rows = [line.strip() for line in lines]
+        overlap = 0
+        for k in range(min(len(tile_rows), len(previous_rows)), 0, -1):
+            if tile_rows[:k] == previous_rows[-k:]:
+                overlap = k
+                break
+        rows.extend(lines[overlap:])
+        previous_rows = tile_rows
+    
+    if header is None:
+        return ""
+    return "\n".join([header] + rows) + "\n"
+
+def save_csv(content, original_image_path, prompt=CSV_PROMPT, model=None):
+    """
+    Save csv for an image in the result store and return the file path.
+    
+    Files are named <image>_<timestamp>_<id>.csv and indexed by image hash,
+    prompt and model, so store.latest(image_path, "csv") finds the newest one.
+    """
+    return store.save(content, original_image_path, "csv", "csv", prompt=prompt, model=model)
+
+def parse_number(value):
+    """
+    Parse a csv cell as a number.
+    
+    Handles thousands separators, a leading currency sign, a trailing percent
+    sign and K/M/B/T abbreviations. Returns an int or float, or None if the
+    cell is not numeric.
+    """
+    text = value.strip().replace(",", "").lstrip("$€£")
+    if not text:
+        return None
+    
+    multiplier = 1
+    if text[-1].upper() in NUMBER_SUFFIXES:
+        multiplier = NUMBER_SUFFIXES[text[-1].upper()]
+        text = text[:-1]
+    elif text.endswith("%"):
+        text = text[:-1]
+    
+    try:
+        number = Decimal(text) * multiplier
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    if number == number.to_integral_value() and ("." not in text or multiplier > 1):
+        return int(number)
+    return float(number)
+
+def parse_csv_table(csv_content):
+    """
+    Parse extracted csv text into a typed pyarrow Table.
+    
+    Rows are validated as they are read: rows with the wrong number of fields
+    are reported and skipped. A column becomes int64 or float64 when every
+    non-empty cell in it is numeric, otherwise it stays a string column.
+    Integer columns with values outside the int64 range stay string columns
+    so no digits are lost.
+    """
+    import pyarrow as pa
+    
+    reader = csv.reader(line for line in csv_content.split("\n") if line.strip())
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("No csv content to parse")
+    header = [name.strip() or f"column_{i}" for i, name in enumerate(header)]
+    
+    columns = [[] for _ in header]
+    numeric = [True] * len(header)
+    for line_number, row in enumerate(reader, start=2):
+        if len(row) != len(header):
+            print(f"Skipping csv line {line_number}: expected {len(header)} fields, got {len(row)}")
+            continue
+        for i, cell in enumerate(row):
+            cell = cell.strip()
+            columns[i].append(cell)
+            if numeric[i] and cell and parse_number(cell) is None:
+                numeric[i] = False
+    
+    arrays = []
+    for i, values in enumerate(columns):
+        numbers = [parse_number(v) if v else None for v in values] if numeric[i] and any(values) else None
+        integers = numbers is not None and all(isinstance(n, int) or n is None for n in numbers)
+        if integers and all(n is None or INT64_MIN <= n <= INT64_MAX for n in numbers):
+            arrays.append(pa.array(numbers, type=pa.int64()))
+        elif numbers is not None and not integers:
+            arrays.append(pa.array([float(n) if n is not None else None for n in numbers], type=pa.float64()))
+        else:
+            arrays.append(pa.array([v if v else None for v in values], type=pa.string()))
+    
+    return pa.Table.from_arrays(arrays, names=header)
+
+def save_parquet(table, original_image_path, prompt=CSV_PROMPT, model=None):
+    """
+    Save a typed table as Parquet in the result store and return the file path.
+    
+    Like save_csv, the file gets a unique name and is indexed with kind "parquet".
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    buffer = pa.BufferOutputStream()
+    pq.write_table(table, buffer)
+    return store.save(buffer.getvalue().to_pybytes(), original_image_path, "parquet", "parquet",
+                      prompt=prompt, model=model)
+
+def dataset_schema():
+    """
+    Long-format schema shared by every part file in the dataset, one row per
+    cell, so tables with different headers and column types read together.
+    Integer cells go in value_integer so values above 2**53 keep every digit.
+    """
+    import pyarrow as pa
+    
+    return pa.schema([
+        ("table_id", pa.string()),
+        ("source", pa.string()),
+        ("extracted_at", pa.timestamp("s")),
+        ("row", pa.int64()),
+        ("column", pa.string()),
+        ("column_type", pa.string()),
+        ("value_integer", pa.int64()),
+        ("value_number", pa.float64()),
+        ("value_text", pa.string()),
+    ])
+
+def append_to_dataset(table, original_image_path, dataset_dir=DATASET_DIR):
+    """
+    Append a typed table to the shared Parquet dataset.
+    
+    The table is stored in long format (see dataset_schema): one row per cell
+    with a table_id, the row index, the column name and type, and the value in
+    value_integer for integer columns, value_number for floating point columns
+    or value_text otherwise. Each call writes a new part file under
+    dataset_dir/source=<image name>/, so existing files are never rewritten,
+    and every file has the same schema so the whole dataset reads with
+    pyarrow.dataset.dataset(dataset_dir, schema=dataset_schema()).
+    Returns the path of the part file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
     image_name = Path(original_image_path).stem
-    # Create timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    # Create markdown filename
-    csv_filename = f"{image_name}_{timestamp}.csv"
-    # Full path for the markdown file
-    csv_path = RESULTS_DIR / csv_filename
+    extracted_at = datetime.datetime.now()
+    table_id = f"{image_name}-{extracted_at.strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}"
     
-    # Save the markdown content
-    with open(csv_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    rows, columns, column_types, integers, numbers, texts = [], [], [], [], [], []
+    for name, column in zip(table.column_names, table.columns):
+        integer = pa.types.is_integer(column.type)
+        floating = pa.types.is_floating(column.type)
+        for row, value in enumerate(column.to_pylist()):
+            rows.append(row)
+            columns.append(name)
+            column_types.append(str(column.type))
+            integers.append(value if integer else None)
+            numbers.append(value if floating else None)
+            texts.append(None if integer or floating or value is None else str(value))
     
-    return csv_path
+    count = len(rows)
+    long_table = pa.Table.from_arrays([
+        pa.array([table_id] * count, type=pa.string()),
+        pa.array([image_name] * count, type=pa.string()),
+        pa.array([extracted_at] * count, type=pa.timestamp("s")),
+        pa.array(rows, type=pa.int64()),
+        pa.array(columns, type=pa.string()),
+        pa.array(column_types, type=pa.string()),
+        pa.array(integers, type=pa.int64()),
+        pa.array(numbers, type=pa.float64()),
+        pa.array(texts, type=pa.string()),
+    ], schema=dataset_schema())
+    
+    partition_dir = Path(dataset_dir) / f"source={image_name}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    part_path = partition_dir / f"part-{table_id}.parquet"
+    pq.write_table(long_table, part_path)
+    return part_path
 
-def image_to_markdown(image_path):
+def image_to_markdown(image_path, tile=False, tile_size=800, overlap=100, max_workers=4, columnar=False, duplicates=None):
+    """
+    Extract the tables in an image as csv and save them to md_results.
+    
+    Args:
+        image_path (str): Path to the image
+        tile (bool): Split tall images into overlapping strips processed concurrently
+        tile_size (int): Strip height in pixels (tiling only)
+        overlap (int): Pixels shared by neighbouring tiles (tiling only)
+        max_workers (int): Number of tiles sent to the model at the same time (tiling only)
+        columnar (bool): Also write typed Parquet output and append it to the shared dataset
+        duplicates (NearDuplicateIndex): Optional image_hash index used to reuse or flag
+            results of near-identical images processed earlier
+    """
     try:
-        # Convert the image to base64
-        base64_image = encode_image_to_base64(image_path)
-
-        # Create the message with the image
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please analyze this image and extract tables from it and make it into a csv file. Only output the csv file. Make sure to extract numbers properly, if there are abbreviations like M, B, K, etc, convert them to the actual number. If any commas are present between numbers, remove them."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
+        if duplicates is not None:
+            image_hash = duplicates.hash_image(image_path)
+            match = duplicates.find(image_hash, "csv")
+            if match:
+                match_path, match_result, distance = match
+                print(f"{image_path} is a near-duplicate of {match_path} (distance {distance})")
+                if duplicates.mode == "reuse":
+                    return match_result
+        
+        tiles = split_image_into_tiles(image_path, tile_size, overlap) if tile else []
+        
+        if len(tiles) > 1:
+            # Process tiles concurrently; map keeps results in tile order
+            base64_tiles = [encode_pil_image_to_base64(t) for t in tiles]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                responses = list(executor.map(lambda b: request_markdown(b, TILE_PROMPT), base64_tiles))
+            # A slice without a table has no csv fence; treat it as empty
+            csv_content = stitch_csv_tiles([extract_csv(content) if "```csv" in content else "" for content, _ in responses])
+            model = ",".join(sorted({model for _, model in responses}))
+            prompt = TILE_PROMPT
+        else:
+            # Convert the image to base64
+            base64_image = encode_image_to_base64(image_path)
+            content, model = request_markdown(base64_image, CSV_PROMPT)
+            csv_content = extract_csv(content)
+            prompt = CSV_PROMPT
         
-        csv_content = response.choices[0].message.content
-        # extract the csv content from the response by getting the text between ```csv and ```
-        # remove the first line of the csv content
-        csv_content = csv_content.split("```csv")[1].split("```")[0]
-        csv_content = csv_content.split("\n")[1:]
-        csv_content = "\n".join(csv_content)
         print(csv_content)
         # Save the markdown content and get the file path
-        saved_path = save_csv(csv_content, image_path)
-        return f"CSV saved to: {saved_path}\n\nContent:\n{csv_content}"
+        saved_path = save_csv(csv_content, image_path, prompt=prompt, model=model)
+        
+        if columnar:
+            table = parse_csv_table(csv_content)
+            parquet_path = save_parquet(table, image_path, prompt=prompt, model=model)
+            part_path = append_to_dataset(table, image_path)
+            print(f"Parquet saved to: {parquet_path}, appended to dataset: {part_path}")
+        
+        result = f"CSV saved to: {saved_path}\n\nContent:\n{csv_content}"
+        if duplicates is not None:
+            duplicates.add(image_path, image_hash, result, "csv")
+        return result
         
     except Exception as e:
         return f"Error processing image: {str(e)}\nType: {type(e)}"
@@ -76,5 +297,5 @@ def image_to_markdown(image_path):
 # Example usage
 if __name__ == "__main__":
     image_path = "images/dd_all_sources.png"  # Replace with your image path
-    result = image_to_markdown(image_path)
+    result = image_to_markdown(image_path, tile=True)
     print(result)
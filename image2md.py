@@ -1,68 +1,218 @@
-import os
-from openai import OpenAI
-import PIL.Image
+from llm_client import get_client
+from model_router import vision_router
+from result_store import ResultStore
 import base64
 from io import BytesIO
 from pathlib import Path
-import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize OpenAI client
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
-# Create md_results directory if it doesn't exist
+# Results directory, created on first save
 RESULTS_DIR = Path("md_results")
-RESULTS_DIR.mkdir(exist_ok=True)
+
+# Index of saved results keyed by source image hash, prompt and model
+store = ResultStore(RESULTS_DIR)
+
+MARKDOWN_PROMPT = "Please analyze this image and convert its contents into well-formatted markdown. Include all relevant details and maintain a clear structure."
+TILE_PROMPT = MARKDOWN_PROMPT + " This image is one slice of a larger image, so content may be cut off at the edges. Repeat table headers at the top of every table."
 
 def encode_image_to_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
-def save_markdown(content, original_image_path):
-    # Get the original image filename without extension
-    image_name = Path(original_image_path).stem
-    # Create timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    # Create markdown filename
-    markdown_filename = f"{image_name}_{timestamp}.md"
-    # Full path for the markdown file
-    markdown_path = RESULTS_DIR / markdown_filename
+def encode_pil_image_to_base64(pil_image):
+    """Convert a PIL image to a base64 JPEG string."""
+    buffered = BytesIO()
+    pil_image.convert("RGB").save(buffered, format="JPEG")
+    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+def split_image_into_tiles(image_path, tile_size=800, overlap=100):
+    """
+    Split a tall image into overlapping horizontal strips.
+    
+    Images are only cut top-to-bottom: the strips are stitched back together
+    as consecutive lines or rows, and cutting a wide image left-to-right would
+    split table columns instead. Images no taller than tile_size stay whole.
+    
+    Args:
+        image_path (str): Path to the image
+        tile_size (int): Height of each strip in pixels
+        overlap (int): Number of pixels shared by neighbouring strips
+        
+    Returns:
+        list: PIL images in top-to-bottom order
+    """
+    import PIL.Image
     
-    # Save the markdown content
-    with open(markdown_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    image = PIL.Image.open(image_path)
+    width, height = image.size
     
-    return markdown_path
+    if height <= tile_size:
+        return [image]
+    
+    step = max(1, tile_size - overlap)
+    tiles = []
+    top = 0
+    while True:
+        bottom = min(top + tile_size, height)
+        tiles.append(image.crop((0, top, width, bottom)))
+        if bottom >= height:
+            break
+        top += step
+    return tiles
 
-def image_to_markdown(image_path):
-    try:
-        # Convert the image to base64
-        base64_image = encode_image_to_base64(image_path)
+def request_markdown(base64_image, prompt=MARKDOWN_PROMPT):
+    """
+    Send one base64 encoded image with a prompt to the model and return
+    (response text, model used). image2csv uses it with its csv prompts.
+    """
+    response = vision_router.chat_completion(
+        get_client(),
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": f"data:image/jpeg;base64,{base64_image}"
+                    }
+                ]
+            }
+        ],
+        max_tokens=1000
+    )
+    return response.choices[0].message.content, response.model
+
+def strip_code_fence(content):
+    """Remove a surrounding ```markdown fence if the model wrapped its answer in one."""
+    lines = content.strip().split("\n")
+    if lines and lines[0].startswith("```"):
+        lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+    return "\n".join(lines)
+
+def is_table_separator(line):
+    """Check whether a line is a markdown table separator such as |---|---|."""
+    stripped = line.strip()
+    return stripped.startswith("|") and set(stripped) <= set("|-: ")
+
+def open_table_header(lines):
+    """Return the header row of the table the lines end in, or None if they do not end in a table."""
+    end = len(lines)
+    while end > 0 and not lines[end - 1].strip():
+        end -= 1
+    start = end
+    while start > 0 and lines[start - 1].strip().startswith("|"):
+        start -= 1
+    for i in range(start + 1, end):
+        if is_table_separator(lines[i]):
+            return lines[i - 1].strip()
+    return None
+
+def drop_repeated_header(lines, header):
+    """Drop a header row and its separator at the start of lines if they repeat header."""
+    if (header is not None and len(lines) >= 2 and lines[0].strip() == header
+            and is_table_separator(lines[1])):
+        return lines[2:]
+    return lines
 
-        # Create the message with the image
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please analyze this image and convert its contents into well-formatted markdown. Include all relevant details and maintain a clear structure."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
+def stitch_markdown_tiles(tile_contents):
+    """
+    Join the markdown of neighbouring tiles into one document.
+    
+    The longest run of lines at the start of a tile that repeats the last lines
+    of the previous tile comes from the overlap region and is dropped; repeated
+    lines elsewhere are kept. A table header at the start of a tile, before or
+    right after that run, is dropped when it repeats the header of the table
+    the document ends in, so the table continues across tiles.
+    """
+    stitched = []
+    previous_lines = []
+    
+    for content in tile_contents:
+        lines = [line.rstrip() for line in strip_code_fence(content).strip().split("\n")]
+        if not any(lines):
+            previous_lines = []
+            continue
+        header = open_table_header(stitched)
+        lines = drop_repeated_header(lines, header)
+        
+        tile_lines = [line.strip() for line in lines]
+        overlap = 0
+        for k in range(min(len(tile_lines), len(previous_lines)), 0, -1):
+            if tile_lines[:k] == previous_lines[-k:]:
+                overlap = k
+                break
+        kept = drop_repeated_header(lines[overlap:], header)
+        while kept and not kept[0].strip():
+            kept = kept[1:]
+        previous_lines = tile_lines
+        
+        # Separate from the previous tile unless a table continues
+        if stitched and kept and not (stitched[-1].strip().startswith("|") and kept[0].strip().startswith("|")):
+            stitched.append("")
+        stitched.extend(kept)
+    
+    return "\n".join(stitched)
+
+def save_markdown(content, original_image_path, prompt=MARKDOWN_PROMPT, model=None, kind="md"):
+    """
+    Save markdown for an image in the result store and return the file path.
+    
+    Files are named <image>_<timestamp>_<id>.md and indexed by image hash, kind,
+    prompt and model, so store.latest(image_path, "md") finds the newest one.
+    """
+    return store.save(content, original_image_path, kind, "md", prompt=prompt, model=model)
+
+def image_to_markdown(image_path, tile=False, tile_size=800, overlap=100, max_workers=4, duplicates=None):
+    """
+    Convert an image to markdown and save it to md_results.
+    
+    Args:
+        image_path (str): Path to the image
+        tile (bool): Split tall images into overlapping strips processed concurrently
+        tile_size (int): Strip height in pixels (tiling only)
+        overlap (int): Pixels shared by neighbouring tiles (tiling only)
+        max_workers (int): Number of tiles sent to the model at the same time (tiling only)
+        duplicates (NearDuplicateIndex): Optional image_hash index used to reuse or flag
+            results of near-identical images processed earlier
+    """
+    try:
+        if duplicates is not None:
+            image_hash = duplicates.hash_image(image_path)
+            match = duplicates.find(image_hash, "md")
+            if match:
+                match_path, match_result, distance = match
+                print(f"{image_path} is a near-duplicate of {match_path} (distance {distance})")
+                if duplicates.mode == "reuse":
+                    return match_result
+        
+        tiles = split_image_into_tiles(image_path, tile_size, overlap) if tile else []
+        
+        if len(tiles) > 1:
+            # Process tiles concurrently; map keeps results in tile order
+            base64_tiles = [encode_pil_image_to_base64(t) for t in tiles]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                responses = list(executor.map(lambda b: request_markdown(b, TILE_PROMPT), base64_tiles))
+            markdown_content = stitch_markdown_tiles([content for content, _ in responses])
+            model = ",".join(sorted({model for _, model in responses}))
+            prompt = TILE_PROMPT
+        else:
+            # Convert the image to base64
+            base64_image = encode_image_to_base64(image_path)
+            markdown_content, model = request_markdown(base64_image)
+            prompt = MARKDOWN_PROMPT
         
-        markdown_content = response.choices[0].message.content
         # Save the markdown content and get the file path
-        saved_path = save_markdown(markdown_content, image_path)
-        return f"Markdown saved to: {saved_path}\n\nContent:\n{markdown_content}"
+        saved_path = save_markdown(markdown_content, image_path, prompt=prompt, model=model)
+        result = f"Markdown saved to: {saved_path}\n\nContent:\n{markdown_content}"
+        if duplicates is not None:
+            duplicates.add(image_path, image_hash, result, "md")
+        return result
         
     except Exception as e:
         return f"Error processing image: {str(e)}\nType: {type(e)}"
@@ -70,5 +220,5 @@ def image_to_markdown(image_path):
 # Example usage
 if __name__ == "__main__":
     image_path = "images/dd_all_sources.png"  # Replace with your image path
-    result = image_to_markdown(image_path)
+    result = image_to_markdown(image_path, tile=True)
     print(result)
@@ -0,0 +1,182 @@
+import os
+import json
+import threading
+from pathlib import Path
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash: compare neighbouring pixels of a small grayscale copy.
+
+    Returns a hash_size * hash_size bit integer.
+    """
+    import PIL.Image
+
+    if not isinstance(image, PIL.Image.Image):
+        image = PIL.Image.open(image)
+    small = image.convert("L").resize((hash_size + 1, hash_size), PIL.Image.LANCZOS)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    """
+    Perceptual hash: threshold the low frequency DCT coefficients of a small
+    grayscale copy against their median.
+
+    Returns a hash_size * hash_size bit integer.
+    """
+    import numpy as np
+    import PIL.Image
+
+    if not isinstance(image, PIL.Image.Image):
+        image = PIL.Image.open(image)
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(image.convert("L").resize((size, size), PIL.Image.LANCZOS), dtype=np.float64)
+
+    # 2D DCT-II as two matrix products
+    n = np.arange(size)
+    dct_matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    low = (dct_matrix @ pixels @ dct_matrix.T)[:hash_size, :hash_size]
+
+    bits = (low > np.median(low)).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+class MultiIndexHash:
+    """
+    Index of 64-bit hashes supporting Hamming distance range queries.
+
+    Each hash is split into max_distance + 1 chunks, each with its own exact
+    lookup table. Two hashes within max_distance bits must agree exactly on at
+    least one chunk, so a query only checks hashes sharing a chunk with it
+    instead of scanning every stored hash.
+    """
+
+    def __init__(self, max_distance=4, bits=64):
+        self.max_distance = max_distance
+        self.bits = bits
+        chunks = max_distance + 1
+        # Chunk boundaries spread the bits as evenly as possible
+        self.bounds = [(i * bits // chunks, (i + 1) * bits // chunks) for i in range(chunks)]
+        self.tables = [{} for _ in self.bounds]
+        self.values = {}  # hash -> list of keys
+
+    def chunk(self, value, start, end):
+        return (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, value, key):
+        if value not in self.values:
+            self.values[value] = []
+            for table, (start, end) in zip(self.tables, self.bounds):
+                table.setdefault(self.chunk(value, start, end), []).append(value)
+        self.values[value].append(key)
+
+    def query(self, value, max_distance=None):
+        """Return (distance, hash, keys) for stored hashes within max_distance, closest first."""
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"Index was built for distances up to {self.max_distance}")
+
+        candidates = set()
+        for table, (start, end) in zip(self.tables, self.bounds):
+            candidates.update(table.get(self.chunk(value, start, end), ()))
+
+        matches = []
+        for candidate in candidates:
+            distance = (candidate ^ value).bit_count()
+            if distance <= max_distance:
+                matches.append((distance, candidate, self.values[candidate]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.values.values())
+
+class NearDuplicateIndex:
+    """
+    Remember results per image and find earlier results for near-identical images.
+
+    Results are kept per kind ("md", "csv"), so one index can be shared by
+    image2md and image2csv without returning a markdown result for a csv
+    request. mode is "reuse" to return the earlier result for a
+    near-duplicate, or "flag" to only report it and process the image again.
+    The index can be persisted to a JSON lines file with save()/load().
+    """
+
+    def __init__(self, max_distance=4, method="dhash", mode="reuse"):
+        if mode not in ("reuse", "flag"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.hash_function = HASH_FUNCTIONS[method]
+        self.method = method
+        self.mode = mode
+        self.index = MultiIndexHash(max_distance)
+        self.results = {}  # (kind, image path) -> (hash, result)
+        self.lock = threading.Lock()
+
+    def hash_image(self, image_path):
+        return self.hash_function(image_path)
+
+    def find(self, image_hash, kind):
+        """Return (image_path, result, distance) of the closest earlier image with a result of kind, or None."""
+        with self.lock:
+            for distance, _, keys in self.index.query(image_hash):
+                for key in keys:
+                    if key[0] == kind:
+                        return key[1], self.results[key][1], distance
+            return None
+
+    def add(self, image_path, image_hash, result, kind):
+        with self.lock:
+            key = (kind, str(image_path))
+            if key not in self.results:
+                self.index.add(image_hash, key)
+            self.results[key] = (image_hash, result)
+
+    def save(self, path):
+        # Write a temporary file and rename it so a crash never leaves a truncated index
+        temp_path = f"{path}.tmp"
+        with self.lock, open(temp_path, "w", encoding="utf-8") as f:
+            for (kind, image_path), (image_hash, result) in self.results.items():
+                f.write(json.dumps({"path": image_path, "kind": kind, "method": self.method,
+                                    "hash": image_hash, "result": result}) + "\n")
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        if not Path(path).exists():
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                # Hashes from a different method are not comparable
+                if entry.get("method", self.method) != self.method:
+                    continue
+                self.add(entry["path"], entry["hash"], entry["result"], entry["kind"])
+
+def add_dedupe_arguments(parser):
+    """Add the near-duplicate options used by cli.py and job_queue.py to an argparse parser."""
+    parser.add_argument("--dedupe", action="store_true", help="Reuse or flag results of near-identical images")
+    parser.add_argument("--max-distance", type=int, default=4,
+                        help="Largest Hamming distance between hashes counted as a near-duplicate")
+    parser.add_argument("--dedupe-mode", choices=["reuse", "flag"], default="reuse")
+    parser.add_argument("--dedupe-method", choices=sorted(HASH_FUNCTIONS), default="dhash")
+    parser.add_argument("--dedupe-index", help="JSON lines file the index is loaded from and saved to (implies --dedupe)")
+
+def duplicate_index_from_args(args):
+    """Return the NearDuplicateIndex described by add_dedupe_arguments options, or None if deduplication is off."""
+    if not (args.dedupe or args.dedupe_index):
+        return None
+    duplicates = NearDuplicateIndex(args.max_distance, args.dedupe_method, args.dedupe_mode)
+    if args.dedupe_index:
+        duplicates.load(args.dedupe_index)
+    return duplicates
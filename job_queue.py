@@ -0,0 +1,374 @@
+import os
+import json
+import socket
+import sqlite3
+import argparse
+import datetime
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from image_hash import add_dedupe_arguments, duplicate_index_from_args
+
+# SQLite database holding the queue, job progress and results
+QUEUE_DB = Path("jobs.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id);
+"""
+
+def run_image2md(params, progress):
+    from image2md import image_to_markdown
+    return image_to_markdown(**params)
+
+def run_image2csv(params, progress):
+    from image2csv import image_to_markdown
+    return image_to_markdown(**params)
+
+def run_image2all(params, progress):
+    from image2all import analyze_image
+    return analyze_image(**params)
+
+def run_gen_image(params, progress):
+    from gen_image import generate_image
+    image_path = generate_image(**params)
+    if image_path is None:
+        raise RuntimeError("Image generation failed")
+    return str(image_path)
+
+def run_process_video(params, progress):
+    from video_segmentation_combined import process_video
+    process_video(progress_callback=progress, **params)
+    return params["output_path"]
+
+# Job kind -> handler(params, progress). Handlers import their script lazily
+# so a worker only loads cv2/PIL/openai for the jobs it actually runs.
+JOB_HANDLERS = {
+    "image2md": run_image2md,
+    "image2csv": run_image2csv,
+    "image2all": run_image2all,
+    "gen_image": run_gen_image,
+    "process_video": run_process_video,
+}
+
+# Job kinds whose handler accepts a shared near-duplicate index
+DEDUPE_KINDS = {"image2md", "image2csv"}
+
+def now(seconds_ago=0):
+    # Millisecond timestamps so the planner can measure sub-second job durations
+    return (datetime.datetime.now() - datetime.timedelta(seconds=seconds_ago)).isoformat(timespec="milliseconds")
+
+class JobQueue:
+    """
+    Persistent priority queue of jobs backed by SQLite.
+
+    Higher priority jobs run first, then jobs in submission order. Every
+    thread gets its own connection, so the queue can be shared by the HTTP
+    server and the workers.
+    """
+
+    def __init__(self, db_path=QUEUE_DB):
+        self.db_path = str(db_path)
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def submit(self, kind, params, priority=0):
+        """Add a job and return its id."""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        cursor = self.connect().execute(
+            "INSERT INTO jobs (kind, params, priority, created_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(params), priority, now()),
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker):
+        """Mark the next queued job as running by worker and return it, or None if the queue is empty."""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                started_at = now()
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, worker = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (started_at, worker, started_at, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def set_progress(self, job_id, progress):
+        self.connect().execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def finish(self, job_id, result=None, error=None):
+        self.connect().execute(
+            "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            ("failed" if error else "done", 0 if error else 1, result, error, now(), job_id),
+        )
+
+    def heartbeat(self, worker):
+        """Record that worker is still alive and running its jobs."""
+        self.connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker = ?", (now(), worker)
+        )
+
+    def requeue_interrupted(self, stale_after=60, max_attempts=3):
+        """
+        Put running jobs whose worker stopped sending heartbeats back in the queue.
+
+        Jobs of live workers, including other processes sharing the database,
+        are left alone. A job that has already been started max_attempts times
+        is marked failed instead, so a job that kills its worker is not retried
+        forever.
+        """
+        cutoff = now(stale_after)
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', progress = 0, error = ?, finished_at = ? "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, '') < ? AND attempts >= ?",
+                (f"Worker stopped while running the job {max_attempts} times", now(), cutoff, max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', progress = 0, started_at = NULL, worker = NULL, "
+                "heartbeat_at = NULL WHERE status = 'running' AND COALESCE(heartbeat_at, '') < ?",
+                (cutoff,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, job_id):
+        row = self.connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, status=None, limit=100):
+        if status:
+            rows = self.connect().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+            )
+        else:
+            rows = self.connect().execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+class WorkerPool:
+    """
+    Run queued jobs on a fixed number of worker threads.
+
+    The pool marks the jobs it claims with its worker id and refreshes their
+    heartbeat every heartbeat_interval seconds. Running jobs without a
+    heartbeat for stale_after seconds belong to a process that died and are
+    requeued, or failed after max_attempts starts.
+
+    With a NearDuplicateIndex, image2md and image2csv jobs share it so
+    near-identical images reuse or flag earlier results. If dedupe_index is a
+    path, the index is saved there after every such job.
+    """
+
+    def __init__(self, queue, workers=4, poll_interval=1.0, heartbeat_interval=10, stale_after=60, max_attempts=3,
+                 duplicates=None, dedupe_index=None):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.duplicates = duplicates
+        self.dedupe_index = dedupe_index
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+        self.heartbeat_stop = threading.Event()
+        self.threads = []
+        self.heartbeat_thread = None
+
+    def start(self):
+        self.queue.requeue_interrupted(self.stale_after, self.max_attempts)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.heartbeat_thread = threading.Thread(target=self.beat, name="heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        # Keep the heartbeat going until running jobs are finished
+        self.heartbeat_stop.set()
+        self.heartbeat_thread.join()
+
+    def beat(self):
+        while not self.heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                self.queue.heartbeat(self.worker_id)
+                # Also pick up jobs of other processes that died while this one is running
+                self.queue.requeue_interrupted(self.stale_after, self.max_attempts)
+            except sqlite3.Error as e:
+                print(f"Heartbeat failed: {e}")
+
+    def work(self):
+        while not self.stop_event.is_set():
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.run(job)
+
+    def run(self, job):
+        job_id = job["id"]
+        last_reported = [0.0]
+
+        def progress(fraction):
+            # Only write progress in 1% steps to keep database writes cheap
+            if fraction - last_reported[0] >= 0.01 or fraction >= 1:
+                last_reported[0] = fraction
+                self.queue.set_progress(job_id, fraction)
+
+        print(f"Running job {job_id} ({job['kind']})")
+        params = json.loads(job["params"])
+        dedupe = self.duplicates is not None and job["kind"] in DEDUPE_KINDS
+        if dedupe:
+            params["duplicates"] = self.duplicates
+        try:
+            result = JOB_HANDLERS[job["kind"]](params, progress)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self.queue.finish(job_id, error=f"{str(e)}\nType: {type(e)}")
+            return
+        finally:
+            if dedupe and self.dedupe_index:
+                self.duplicates.save(self.dedupe_index)
+
+        # The image scripts report errors in their return value instead of raising
+        if isinstance(result, str) and result.startswith("Error"):
+            self.queue.finish(job_id, error=result)
+        else:
+            self.queue.finish(job_id, result=str(result))
+        print(f"Finished job {job_id}")
+
+def make_handler(queue):
+    """Build an HTTP handler exposing the queue as a small JSON API."""
+
+    class JobHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            # POST /jobs {"kind": ..., "params": {...}, "priority": 0}
+            if self.path.rstrip("/") != "/jobs":
+                return self.send_json(404, {"error": "Not found"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict) or not isinstance(body.get("params", {}), dict):
+                    raise ValueError("Body must be a JSON object with an object of params")
+                job_id = queue.submit(body["kind"], body.get("params", {}), int(body.get("priority", 0)))
+            except (KeyError, TypeError, ValueError) as e:
+                return self.send_json(400, {"error": str(e)})
+            self.send_json(201, {"id": job_id})
+
+        def do_GET(self):
+            # GET /jobs, GET /jobs?status=queued, GET /jobs/<id>
+            path, _, query = self.path.partition("?")
+            parts = [p for p in path.split("/") if p]
+            if parts == ["jobs"]:
+                status = dict(p.split("=", 1) for p in query.split("&") if "=" in p).get("status")
+                return self.send_json(200, queue.list(status))
+            if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                job = queue.get(int(parts[1]))
+                if job is None:
+                    return self.send_json(404, {"error": "Job not found"})
+                return self.send_json(200, job)
+            self.send_json(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return JobHandler
+
+def serve(db_path=QUEUE_DB, workers=4, host="127.0.0.1", port=8765, duplicates=None, dedupe_index=None):
+    """Start the worker pool and the HTTP API, and run until interrupted."""
+    queue = JobQueue(db_path)
+    pool = WorkerPool(queue, workers=workers, duplicates=duplicates, dedupe_index=dedupe_index)
+    pool.start()
+
+    server = ThreadingHTTPServer((host, port), make_handler(queue))
+    print(f"Job service listening on http://{host}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Waiting for running jobs to finish...")
+        pool.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local job queue for image and video jobs")
+    parser.add_argument("--db", default=str(QUEUE_DB), help="SQLite database path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run workers and the HTTP API")
+    serve_parser.add_argument("--workers", type=int, default=4)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    add_dedupe_arguments(serve_parser)
+
+    submit_parser = subparsers.add_parser("submit", help="Queue a job")
+    submit_parser.add_argument("kind", choices=sorted(JOB_HANDLERS))
+    submit_parser.add_argument("params", help='Job parameters as JSON, e.g. \'{"image_path": "images/dd_all_sources.png"}\'')
+    submit_parser.add_argument("--priority", type=int, default=0)
+
+    status_parser = subparsers.add_parser("status", help="Show jobs")
+    status_parser.add_argument("job_id", nargs="?", type=int)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.db, args.workers, args.host, args.port, duplicate_index_from_args(args), args.dedupe_index)
+    elif args.command == "submit":
+        print(JobQueue(args.db).submit(args.kind, json.loads(args.params), args.priority))
+    else:
+        queue = JobQueue(args.db)
+        jobs = [queue.get(args.job_id)] if args.job_id else queue.list()
+        for job in jobs:
+            if job:
+                print(f"{job['id']}\t{job['kind']}\t{job['status']}\t{job['progress']:.0%}\t{job['error'] or job['result'] or ''}")
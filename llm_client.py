@@ -0,0 +1,10 @@
+import os
+from functools import lru_cache
+
+LITELLM_BASE_URL = "https://litellm.deriv.ai/v1"
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Create the OpenAI client for the LiteLLM proxy on first use and reuse it afterwards."""
+    from openai import OpenAI
+    return OpenAI(base_url=LITELLM_BASE_URL, api_key=os.getenv('LITELLM_API_KEY'))
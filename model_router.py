@@ -0,0 +1,165 @@
+import time
+import threading
+from collections import deque
+
+# Models available behind the LiteLLM proxy and their quality tier
+# (1 = lite, 2 = standard, 3 = high). Edit to match the proxy configuration.
+VISION_MODELS = {
+    "gemini-2.0-flash-001": 2,
+    "gemini-2.0-flash-lite-001": 1,
+    "gemini-1.5-pro-002": 3,
+}
+IMAGE_MODELS = {
+    "imagen-3.0-fast-generate-001": 1,
+    "imagen-3.0-generate-002": 2,
+}
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, float("inf")]
+
+class ModelStats:
+    """Rolling latency and error statistics for a single model."""
+
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)  # (latency_seconds, succeeded)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record(self, latency, succeeded):
+        self.samples.append((latency, succeeded))
+        self.consecutive_failures = 0 if succeeded else self.consecutive_failures + 1
+
+    def histogram(self):
+        """Return successful call counts per latency bucket."""
+        counts = [0] * len(LATENCY_BUCKETS)
+        for latency, succeeded in self.samples:
+            if not succeeded:
+                continue
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    counts[i] += 1
+                    break
+        return counts
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, succeeded in self.samples if not succeeded) / len(self.samples)
+
+    def percentile(self, q=0.9):
+        """Latency percentile of successful calls, or None if there are none yet."""
+        latencies = sorted(latency for latency, succeeded in self.samples if succeeded)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+class ModelRouter:
+    """
+    Send each request to the fastest healthy model that meets a quality tier.
+
+    Models are ranked by their recent p90 latency. A model that fails
+    max_consecutive_failures calls in a row, or whose recent error rate goes
+    above max_error_rate, is skipped for cooldown seconds. If a call fails or
+    takes longer than timeout seconds, the next model in the ranking is tried
+    straight away instead of retrying the same model.
+    """
+
+    def __init__(self, models, window=100, max_error_rate=0.5, min_samples=3,
+                 max_consecutive_failures=3, cooldown=60, default_latency=5.0, timeout=60):
+        self.models = dict(models)
+        self.stats = {name: ModelStats(window) for name in self.models}
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        # Latency assumed for models we have not measured yet
+        self.default_latency = default_latency
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def candidates(self, min_quality=1):
+        """Return model names meeting min_quality, healthy models first, fastest first."""
+        now = time.time()
+        with self.lock:
+            ranked = []
+            for order, (name, quality) in enumerate(self.models.items()):
+                if quality < min_quality:
+                    continue
+                stats = self.stats[name]
+                p90 = stats.percentile(0.9)
+                latency = p90 if p90 is not None else self.default_latency
+                healthy = stats.unhealthy_until <= now
+                ranked.append((not healthy, latency, order, name))
+        return [name for *_, name in sorted(ranked)]
+
+    def record(self, model, latency, succeeded):
+        with self.lock:
+            stats = self.stats[model]
+            stats.record(latency, succeeded)
+            # A model that was healthy until now trips on its recent failures
+            # instead of waiting for them to outweigh the whole window
+            if (stats.consecutive_failures >= self.max_consecutive_failures
+                    or (len(stats.samples) >= self.min_samples
+                        and stats.error_rate() > self.max_error_rate)):
+                stats.unhealthy_until = time.time() + self.cooldown
+                # Start fresh after the cooldown so one bad spell is not held against the model
+                stats.samples.clear()
+                stats.consecutive_failures = 0
+
+    def call(self, request_fn, min_quality=1):
+        """
+        Call request_fn(model) on the best model, falling back on failure.
+
+        Raises the last error if every candidate model fails.
+        """
+        models = self.candidates(min_quality)
+        if not models:
+            raise ValueError(f"No model configured with quality >= {min_quality}")
+
+        last_error = None
+        for model in models:
+            start = time.time()
+            try:
+                result = request_fn(model)
+            except Exception as e:
+                self.record(model, time.time() - start, False)
+                print(f"Model {model} failed, trying next model: {e}")
+                last_error = e
+                continue
+            self.record(model, time.time() - start, True)
+            return result
+        raise last_error
+
+    def fast_fail(self, client):
+        """Return the client with the router timeout and without client retries, so fallback happens quickly."""
+        return client.with_options(timeout=self.timeout, max_retries=0)
+
+    def chat_completion(self, client, min_quality=2, **kwargs):
+        """Route a client.chat.completions.create call."""
+        client = self.fast_fail(client)
+        return self.call(lambda model: client.chat.completions.create(model=model, **kwargs), min_quality)
+
+    def generate_image(self, client, min_quality=1, **kwargs):
+        """Route a client.images.generate call."""
+        client = self.fast_fail(client)
+        return self.call(lambda model: client.images.generate(model=model, **kwargs), min_quality)
+
+    def report(self):
+        """Return per-model quality, p50/p90 latency, error rate and latency histogram."""
+        with self.lock:
+            return {
+                name: {
+                    "quality": self.models[name],
+                    "p50": stats.percentile(0.5),
+                    "p90": stats.percentile(0.9),
+                    "error_rate": stats.error_rate(),
+                    "histogram": dict(zip(LATENCY_BUCKETS, stats.histogram())),
+                    "healthy": stats.unhealthy_until <= time.time(),
+                }
+                for name, stats in self.stats.items()
+            }
+
+# Shared routers so every caller in the process feeds the same statistics
+vision_router = ModelRouter(VISION_MODELS)
+# Image generation is slower than a chat completion
+image_router = ModelRouter(IMAGE_MODELS, timeout=120)
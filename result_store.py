@@ -0,0 +1,143 @@
+import os
+import uuid
+import sqlite3
+import hashlib
+import datetime
+import tempfile
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_hash TEXT NOT NULL,
+    source_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_lookup ON results (source_hash, kind, prompt_hash, model, id);
+CREATE INDEX IF NOT EXISTS results_source ON results (source_hash, kind, id);
+"""
+
+# Result files read back as text; anything else (e.g. Parquet) is read as bytes
+TEXT_EXTENSIONS = {".md", ".csv", ".txt", ".json"}
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+class ResultStore:
+    """
+    Result files indexed in SQLite by source image hash, kind, prompt and model.
+
+    Content files are written atomically (temporary file + rename) under
+    results_dir/<first two hex digits of the source hash>/ with a unique name,
+    so concurrent writers never collide and no directory grows too large. The
+    index answers "latest result" and "all versions" without listing
+    directories.
+    """
+
+    def __init__(self, results_dir="md_results"):
+        # Nothing touches the disk until the first save or query
+        self.results_dir = Path(results_dir)
+        self.db_path = str(self.results_dir / "index.sqlite3")
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def save(self, content, source_path, kind, extension, prompt=None, model=None, source_hash=None):
+        """
+        Atomically write content for a source image and index it.
+
+        content may be str (written as UTF-8) or bytes. Returns the path of
+        the written file.
+        """
+        source_hash = source_hash or hash_file(source_path)
+        stem = Path(source_path).stem
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        shard_dir = self.results_dir / source_hash[:2]
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        path = shard_dir / f"{stem}_{timestamp}_{uuid.uuid4().hex[:8]}.{extension}"
+
+        # Write to a temporary file in the same directory and rename it into place
+        fd, temp_path = tempfile.mkstemp(dir=shard_dir, suffix=".tmp")
+        try:
+            if isinstance(content, bytes):
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+            else:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(content)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+        self.connect().execute(
+            "INSERT INTO results (source_hash, source_name, kind, prompt_hash, model, path, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source_hash, Path(source_path).name, kind, hash_text(prompt), model or "", str(path),
+             datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        return path
+
+    def query(self, source_path=None, kind=None, prompt=None, model=None, source_hash=None, limit=None):
+        """Return index rows for a source image, newest first, optionally filtered by kind, prompt and model."""
+        source_hash = source_hash or hash_file(source_path)
+        sql = "SELECT * FROM results WHERE source_hash = ?"
+        args = [source_hash]
+        if kind is not None:
+            sql += " AND kind = ?"
+            args.append(kind)
+        if prompt is not None:
+            sql += " AND prompt_hash = ?"
+            args.append(hash_text(prompt))
+        if model is not None:
+            sql += " AND model = ?"
+            args.append(model)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [dict(row) for row in self.connect().execute(sql, args)]
+
+    def latest(self, source_path=None, kind=None, prompt=None, model=None, source_hash=None):
+        """Return the newest matching index row, or None."""
+        rows = self.query(source_path, kind, prompt, model, source_hash, limit=1)
+        return rows[0] if rows else None
+
+    def versions(self, source_path=None, kind=None, prompt=None, model=None, source_hash=None):
+        """Return every matching index row, newest first."""
+        return self.query(source_path, kind, prompt, model, source_hash)
+
+    def read(self, row):
+        """
+        Return the content of the file an index row points to: str for text
+        results such as markdown and csv, bytes for binary results such as
+        Parquet.
+        """
+        if Path(row["path"]).suffix.lower() in TEXT_EXTENSIONS:
+            with open(row["path"], encoding="utf-8") as f:
+                return f.read()
+        with open(row["path"], "rb") as f:
+            return f.read()
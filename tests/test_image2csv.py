@@ -0,0 +1,76 @@
+import pytest
+import image2csv
+from image2csv import stitch_csv_tiles, parse_number, parse_csv_table
+from image_hash import NearDuplicateIndex
+from result_store import ResultStore
+
+def test_keeps_header_once_and_drops_overlap_rows():
+    tiles = ["Name,Value\na,1\nb,2\n", "Name,Value\nb,2\nc,3\n"]
+    assert stitch_csv_tiles(tiles) == "Name,Value\na,1\nb,2\nc,3\n"
+
+def test_keeps_repeated_rows_outside_the_overlap():
+    tiles = ["x,y\n0,0\n0,0\n", "x,y\n0,0\n1,1\n"]
+    assert stitch_csv_tiles(tiles) == "x,y\n0,0\n0,0\n1,1\n"
+
+def test_no_content():
+    assert stitch_csv_tiles(["", "\n"]) == ""
+
+@pytest.mark.parametrize("cell, expected", [
+    ("42", 42),
+    ("1,234", 1234),
+    ("$1,234.50", 1234.5),
+    ("54.49M", 54_490_000),
+    ("1.5k", 1500),
+    ("12.5%", 12.5),
+    ("-3", -3),
+    ("2.0", 2.0),
+])
+def test_parse_number(cell, expected):
+    number = parse_number(cell)
+    assert number == expected
+    assert type(number) is type(expected)
+
+@pytest.mark.parametrize("cell", ["", "abc", "N/A", "nan", "inf", "1.2.3"])
+def test_parse_number_rejects_non_numbers(cell):
+    assert parse_number(cell) is None
+
+def test_parse_csv_table_types_columns():
+    pa = pytest.importorskip("pyarrow")
+    table = parse_csv_table("Name,Count,Share\na,1,0.5\nb,2K,\n")
+    assert table.schema.types == [pa.string(), pa.int64(), pa.float64()]
+    assert table.column("Count").to_pylist() == [1, 2000]
+    assert table.column("Share").to_pylist() == [0.5, None]
+
+def test_parse_csv_table_skips_rows_with_wrong_field_count():
+    pytest.importorskip("pyarrow")
+    table = parse_csv_table("a,b\n1,2\n3\n4,5\n")
+    assert table.column("a").to_pylist() == [1, 4]
+
+def test_parse_csv_table_keeps_integers_beyond_int64_as_text():
+    pa = pytest.importorskip("pyarrow")
+    table = parse_csv_table("id\n12345678901234567890\n1\n")
+    assert table.schema.types == [pa.string()]
+    assert table.column("id").to_pylist() == ["12345678901234567890", "1"]
+
+def test_parse_csv_table_without_content():
+    pytest.importorskip("pyarrow")
+    with pytest.raises(ValueError):
+        parse_csv_table("\n")
+
+def test_image_to_markdown_reuses_csv_but_not_markdown_results(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(image2csv, "store", ResultStore(tmp_path / "results"))
+    monkeypatch.setattr(image2csv, "request_markdown",
+                        lambda image, prompt: calls.append(prompt) or ("```csv\na,b\n1,2\n```", "model"))
+    duplicates = NearDuplicateIndex()
+    duplicates.hash_image = lambda image_path: 0
+    duplicates.add("earlier.png", 0, "markdown result", "md")
+    first, second = tmp_path / "a.png", tmp_path / "b.png"
+    first.write_bytes(b"a")
+    second.write_bytes(b"b")
+
+    result = image2csv.image_to_markdown(first, duplicates=duplicates)
+    assert result.startswith("CSV saved to:")
+    assert result.endswith("a,b\n1,2\n")
+    assert image2csv.image_to_markdown(second, duplicates=duplicates) == result
+    assert len(calls) == 1
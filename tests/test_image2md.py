@@ -0,0 +1,55 @@
+import image2md
+from image2md import stitch_markdown_tiles
+from image_hash import NearDuplicateIndex
+from result_store import ResultStore
+
+def test_drops_overlap_run_between_tiles():
+    tiles = ["# Title\n\nFirst line\nSecond line", "Second line\nThird line"]
+    assert stitch_markdown_tiles(tiles) == "# Title\n\nFirst line\nSecond line\n\nThird line"
+
+def test_keeps_repeated_rows_outside_the_overlap():
+    tiles = ["| x | 0 |\n| y | 0 |", "| y | 0 |\n| x | 0 |\n| z | 0 |"]
+    assert stitch_markdown_tiles(tiles) == "| x | 0 |\n| y | 0 |\n| x | 0 |\n| z | 0 |"
+
+def test_continues_table_across_tiles():
+    tiles = [
+        "| Name | Value |\n|---|---|\n| a | 1 |\n| b | 2 |",
+        "| Name | Value |\n|---|---|\n| b | 2 |\n| c | 3 |",
+    ]
+    assert stitch_markdown_tiles(tiles) == "| Name | Value |\n|---|---|\n| a | 1 |\n| b | 2 |\n| c | 3 |"
+
+def test_drops_header_right_after_the_overlap():
+    tiles = [
+        "| Name | Value |\n|---|---|\n| a | 1 |\n| b | 2 |",
+        "| b | 2 |\n| Name | Value |\n|---|---|\n| c | 3 |",
+    ]
+    assert stitch_markdown_tiles(tiles) == "| Name | Value |\n|---|---|\n| a | 1 |\n| b | 2 |\n| c | 3 |"
+
+def test_keeps_header_of_a_second_table_with_the_same_columns():
+    tiles = [
+        "| Name | Value |\n|---|---|\n| a | 1 |",
+        "| a | 1 |\n\nSome text\n\n| Name | Value |\n|---|---|\n| q | 9 |",
+    ]
+    stitched = stitch_markdown_tiles(tiles)
+    assert stitched.count("| Name | Value |") == 2
+    assert stitched.endswith("Some text\n\n| Name | Value |\n|---|---|\n| q | 9 |")
+
+def test_strips_code_fences_and_skips_empty_tiles():
+    tiles = ["```markdown\nA\n```", "", "B"]
+    assert stitch_markdown_tiles(tiles) == "A\n\nB"
+
+def test_image_to_markdown_reuses_near_duplicate_results(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(image2md, "store", ResultStore(tmp_path / "results"))
+    monkeypatch.setattr(image2md, "request_markdown",
+                        lambda image, prompt=image2md.MARKDOWN_PROMPT: calls.append(prompt) or ("# Page", "model"))
+    duplicates = NearDuplicateIndex()
+    duplicates.hash_image = lambda image_path: 0
+    first, second = tmp_path / "a.png", tmp_path / "b.png"
+    first.write_bytes(b"a")
+    second.write_bytes(b"b")
+
+    result = image2md.image_to_markdown(first, duplicates=duplicates)
+    assert result.startswith("Markdown saved to:")
+    assert image2md.image_to_markdown(second, duplicates=duplicates) == result
+    assert len(calls) == 1
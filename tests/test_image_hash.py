@@ -0,0 +1,46 @@
+import random
+from image_hash import MultiIndexHash, NearDuplicateIndex
+
+def test_multi_index_query_matches_brute_force():
+    rng = random.Random(0)
+    index = MultiIndexHash(max_distance=4)
+    values = [rng.getrandbits(64) for _ in range(200)]
+    # Add near copies so some queries have matches
+    values += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in values[:50]]
+    for key, value in enumerate(values):
+        index.add(value, key)
+
+    for query in values[:60] + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted((bin(query ^ value).count("1"), key)
+                          for key, value in enumerate(values) if bin(query ^ value).count("1") <= 4)
+        found = sorted((distance, key) for distance, _, keys in index.query(query) for key in keys)
+        assert found == expected
+
+def test_multi_index_query_is_sorted_by_distance():
+    index = MultiIndexHash(max_distance=4)
+    index.add(0b1111, "far")
+    index.add(0b0001, "near")
+    assert [keys for _, _, keys in index.query(0)] == [["near"], ["far"]]
+
+def test_near_duplicates_are_kept_per_kind(tmp_path):
+    duplicates = NearDuplicateIndex(max_distance=4)
+    duplicates.add("a.png", 0b1011, "markdown result", "md")
+    assert duplicates.find(0b1010, "md") == ("a.png", "markdown result", 1)
+    assert duplicates.find(0b1010, "csv") is None
+
+    duplicates.add("a.png", 0b1011, "csv result", "csv")
+    path = tmp_path / "index.jsonl"
+    duplicates.save(path)
+    loaded = NearDuplicateIndex(max_distance=4)
+    loaded.load(path)
+    assert loaded.find(0b1011, "csv") == ("a.png", "csv result", 0)
+    assert loaded.find(0b1011, "md") == ("a.png", "markdown result", 0)
+
+def test_load_skips_hashes_from_another_method(tmp_path):
+    duplicates = NearDuplicateIndex(method="phash")
+    duplicates.add("a.png", 1, "result", "md")
+    path = tmp_path / "index.jsonl"
+    duplicates.save(path)
+    loaded = NearDuplicateIndex(method="dhash")
+    loaded.load(path)
+    assert loaded.find(1, "md") is None
@@ -0,0 +1,62 @@
+import pytest
+from model_router import ModelRouter
+
+def make_router(**kwargs):
+    return ModelRouter({"fast": 2, "slow": 2, "lite": 1}, **kwargs)
+
+def test_candidates_filter_by_quality_and_rank_by_latency():
+    router = make_router()
+    for _ in range(5):
+        router.record("fast", 0.5, True)
+        router.record("slow", 4.0, True)
+    assert router.candidates(2) == ["fast", "slow"]
+    # Unmeasured models are ranked at default_latency
+    assert router.candidates(1) == ["fast", "slow", "lite"]
+    assert router.candidates(3) == []
+
+def test_consecutive_failures_trip_the_cooldown():
+    router = make_router(max_consecutive_failures=3)
+    for _ in range(100):
+        router.record("fast", 0.5, True)
+    router.record("fast", 0.5, False)
+    router.record("fast", 0.5, False)
+    assert router.candidates(2)[0] == "fast"
+    router.record("fast", 0.5, False)
+    assert router.candidates(2) == ["slow", "fast"]
+    assert not router.report()["fast"]["healthy"]
+
+def test_success_resets_consecutive_failures():
+    router = make_router(max_consecutive_failures=3)
+    for _ in range(10):
+        router.record("fast", 0.5, True)
+    for succeeded in [False, False, True, False, False]:
+        router.record("fast", 0.5, succeeded)
+    assert router.report()["fast"]["healthy"]
+
+def test_error_rate_trips_the_cooldown():
+    router = make_router(max_error_rate=0.5, min_samples=3, max_consecutive_failures=10)
+    for succeeded in [True, False, False]:
+        router.record("fast", 0.5, succeeded)
+    assert not router.report()["fast"]["healthy"]
+
+def test_call_falls_back_to_the_next_model():
+    router = make_router()
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        if model == "fast":
+            raise RuntimeError("unavailable")
+        return model
+
+    assert router.call(request, min_quality=2) == "slow"
+    assert calls == ["fast", "slow"]
+
+def test_call_raises_the_last_error_when_every_model_fails():
+    router = make_router()
+
+    def request(model):
+        raise RuntimeError(model)
+
+    with pytest.raises(RuntimeError):
+        router.call(request, min_quality=2)
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("numpy")
+from video_segmentation_combined import parse_compact_detections
+
+def test_parses_codes_and_scales_coordinates():
+    result = parse_compact_detections("r 100 200 300 400\nb 0 0 1000 500")
+    assert result == {"objects": [
+        {"color": "red", "bbox": [0.1, 0.2, 0.3, 0.4]},
+        {"color": "blue", "bbox": [0.0, 0.0, 1.0, 0.5]},
+    ]}
+
+def test_tolerates_fences_numbering_names_and_punctuation():
+    text = "```\n1. r 100 200 300 400\n2) yellow: [100, 200, 300, 400]\n- b,100,200,300,400\n```"
+    result = parse_compact_detections(text)
+    assert [obj["color"] for obj in result["objects"]] == ["red", "yellow", "blue"]
+    assert all(obj["bbox"] == [0.1, 0.2, 0.3, 0.4] for obj in result["objects"])
+
+def test_accepts_normalized_floats_and_orders_corners():
+    result = parse_compact_detections("r 0.4 0.3 0.2 0.1")
+    assert result["objects"][0]["bbox"] == [0.2, 0.1, 0.4, 0.3]
+
+def test_clamps_coordinates():
+    result = parse_compact_detections("y -5 0 1200 1000")
+    assert result["objects"][0]["bbox"] == [0.0, 0.0, 1.0, 1.0]
+
+def test_reads_confidence():
+    result = parse_compact_detections("r 100 200 300 400 85\nb 100 200 300 400 0.5")
+    assert [obj["confidence"] for obj in result["objects"]] == [0.85, 0.5]
+
+def test_skips_unparseable_lines():
+    text = "Here are the objects:\ng 100 200 300 400\nr 100 200\nr 100 200 300 400"
+    assert parse_compact_detections(text) == {"objects": [{"color": "red", "bbox": [0.1, 0.2, 0.3, 0.4]}]}
@@ -3,16 +3,14 @@ import base64
 from io import BytesIO
 from pathlib import Path
 import datetime
-from openai import OpenAI
+from llm_client import get_client
+from model_router import vision_router
 from PIL import Image
 import time
 import av  # PyAV for video processing
 import tempfile
 import subprocess
 
-# Initialize OpenAI client (using LiteLLM proxy as in your image2md.py)
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
 def encode_image_to_base64(pil_image):
     """Convert a PIL image to base64 string."""
     buffered = BytesIO()
@@ -35,8 +33,8 @@ def segment_colored_objects_with_gemini(pil_image):
     
     # Create the message with the image
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
+        response = vision_router.chat_completion(
+            get_client(),
             messages=[
                 {
                     "role": "user",
@@ -5,13 +5,11 @@ import re
 import time
 import cv2
 import numpy as np
-from openai import OpenAI
+from llm_client import get_client
+from model_router import vision_router
 from PIL import Image
 import json
 
-# Initialize OpenAI client (using LiteLLM proxy)
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
 def pil_to_cv2(pil_image):
     """Convert PIL image to OpenCV format (BGR)"""
     # Convert PIL image to RGB numpy array
@@ -59,8 +57,8 @@ def segment_with_direct_image(cv2_image):
     
     # Create the message with the image
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
+        response = vision_router.chat_completion(
+            get_client(),
             messages=[
                 {
                     "role": "user",
@@ -99,25 +97,83 @@ def segment_with_direct_image(cv2_image):
         print(f"Error calling Gemini API: {e}")
         return cv2_image
 
-def segment_with_bounding_boxes(cv2_image):
+DETECTION_PROMPT = "Identify all red, blue, and yellow objects in this image. Return a JSON with the following format: {\"objects\": [{\"color\": \"red/blue/yellow\", \"bbox\": [x1, y1, x2, y2]}]}. Where bbox coordinates are normalized between 0 and 1."
+CONFIDENCE_PROMPT = " Also add a \"confidence\" field between 0 and 1 to each object."
+REFINE_PROMPT = "This image is a crop around a {color} object. Return a JSON with the following format: {{\"objects\": [{{\"color\": \"{color}\", \"bbox\": [x1, y1, x2, y2]}}]}} containing a tight bounding box for that object. Where bbox coordinates are normalized between 0 and 1."
+
+# Compact wire format: one object per line as "<code> x1 y1 x2 y2 [confidence]" with
+# integer coordinates from 0 to 1000, which needs far fewer completion tokens than JSON
+COLOR_CODES = {"r": "red", "b": "blue", "y": "yellow"}
+COMPACT_DETECTION_PROMPT = "Identify all red, blue, and yellow objects in this image. Output one object per line as: c x1 y1 x2 y2, where c is r (red), b (blue) or y (yellow) and the coordinates are integers from 0 to 1000 relative to the image width and height. Output nothing else."
+COMPACT_CONFIDENCE_PROMPT = " Add a sixth value per line: your confidence as an integer from 0 to 100."
+COMPACT_REFINE_PROMPT = "This image is a crop around a {color} object. Output a tight bounding box for that object as one line: {code} x1 y1 x2 y2, with integer coordinates from 0 to 1000 relative to the image width and height. Output nothing else."
+
+def parse_compact_detections(text):
     """
-    Send a frame to Gemini to detect and segment red, blue, and yellow objects.
-    Returns the processed image with segmented objects and bounding boxes.
+    Parse compact detection lines into the {"objects": [...]} structure used by
+    draw_colored_bounding_boxes.
+    
+    Tolerates code fences, list numbering, commas, brackets, full colour names
+    and 0-1 floats.
+    Lines that cannot be parsed are skipped.
+    """
+    objects = []
+    for line in text.split("\n"):
+        tokens = re.findall(r"[A-Za-z]+|-?\d+(?:\.\d+)?", line)
+        # Skip list numbering such as "1." or "2)" before the colour code
+        while tokens and not tokens[0][0].isalpha():
+            tokens = tokens[1:]
+        if not tokens:
+            continue
+        color = COLOR_CODES.get(tokens[0].lower(), tokens[0].lower())
+        if color not in COLOR_CODES.values():
+            continue
+        numbers = [t for t in tokens[1:] if not t[0].isalpha()]
+        if len(numbers) < 4:
+            continue
+        values = [float(v) for v in numbers[:5]]
+        
+        coords = values[:4]
+        # Coordinates are expected on a 0-1000 scale; accept normalized floats too
+        scale = 1 if all(v <= 1 for v in coords) and any("." in v for v in numbers[:4]) else 1000
+        x1, y1, x2, y2 = [min(1.0, max(0.0, v / scale)) for v in coords]
+        obj = {"color": color, "bbox": [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]}
+        if len(values) > 4:
+            # Integer confidences are on a 0-100 scale
+            obj["confidence"] = values[4] if "." in numbers[4] else values[4] / 100
+        objects.append(obj)
+    return {"objects": objects}
+
+def resize_for_inference(cv2_image, max_side=None):
+    """Return a copy of the image scaled down so its longest side is at most max_side pixels."""
+    height, width = cv2_image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return cv2_image
+    scale = max_side / max(height, width)
+    return cv2.resize(cv2_image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+def detect_objects(cv2_image, prompt=DETECTION_PROMPT, compact=False, token_usage=None):
+    """
+    Send an image to Gemini and return the parsed detection JSON, or None on failure.
+    Bounding boxes are normalized, so they apply to any resolution of the same image.
+    With compact=True the prompt must ask for the compact line format.
+    If token_usage is a dict, the call and its completion tokens are added to its
+    "calls" and "completion_tokens" counts.
     """
     # Convert the OpenCV image to base64
     base64_image = encode_image_to_base64(cv2_image)
     
     # Create the message with the image
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
+        response = vision_router.chat_completion(
+            get_client(),
             messages=[
                 {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": "Identify all red, blue, and yellow objects in this image. Return a JSON with the following format: {\"objects\": [{\"color\": \"red/blue/yellow\", \"bbox\": [x1, y1, x2, y2]}]}. Where bbox coordinates are normalized between 0 and 1."
+                            "text": prompt
                         },
                         {
                             "type": "image_url",
@@ -128,31 +184,134 @@ def segment_with_bounding_boxes(cv2_image):
             ],
             max_tokens=1000
         )
+    except Exception as e:
+        print(f"Error calling Gemini API: {e}")
+        return None
+    
+    # Extract the response content
+    result_text = response.choices[0].message.content
+    
+    usage = getattr(response, "usage", None)
+    if token_usage is not None and usage is not None and usage.completion_tokens is not None:
+        token_usage["calls"] += 1
+        token_usage["completion_tokens"] += usage.completion_tokens
+    
+    if compact:
+        return parse_compact_detections(result_text)
+    
+    # Try to parse JSON from the response
+    try:
+        # Find JSON in the response (it might be surrounded by markdown or other text)
+        json_start = result_text.find('{')
+        json_end = result_text.rfind('}') + 1
+        if json_start >= 0 and json_end > json_start:
+            json_str = result_text[json_start:json_end]
+            return json.loads(json_str)
+        else:
+            print("No valid JSON found in response")
+            return None
+    except Exception as e:
+        print(f"Error processing response: {e}")
+        print(f"Response was: {result_text}")
+        return None
+
+def is_valid_bbox(bbox):
+    """Check that a bbox is a list of four numbers."""
+    return (isinstance(bbox, list) and len(bbox) == 4
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in bbox))
+
+def refine_detections(cv2_image, result_json, inference_size=None, min_area=0.01,
+                      min_confidence=0.5, padding=0.5, max_refinements=4, compact=False,
+                      token_usage=None):
+    """
+    Re-detect small or uncertain objects on tight full-resolution crops.
+    
+    An object is refined when its normalized bbox area is below min_area or its
+    confidence is below min_confidence. The crop is the bbox grown by padding
+    (as a fraction of its size) on every side, and the refined bbox is mapped
+    back to coordinates normalized to the whole frame.
+    """
+    height, width = cv2_image.shape[:2]
+    refined = 0
+    
+    for obj in result_json.get("objects") or []:
+        if refined >= max_refinements:
+            break
+        if not isinstance(obj, dict):
+            continue
+        bbox = obj.get("bbox")
+        if not is_valid_bbox(bbox) or "color" not in obj:
+            continue
         
-        # Extract the response content
-        result_text = response.choices[0].message.content
+        x1, y1, x2, y2 = bbox
+        small = (x2 - x1) * (y2 - y1) < min_area
+        confidence = obj.get("confidence", 1)
+        uncertain = isinstance(confidence, (int, float)) and confidence < min_confidence
+        if not (small or uncertain):
+            continue
         
-        # Try to parse JSON from the response
-        try:
-            # Find JSON in the response (it might be surrounded by markdown or other text)
-            json_start = result_text.find('{')
-            json_end = result_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = result_text[json_start:json_end]
-                result_json = json.loads(json_str)
-                
-                # Draw bounding boxes on the image
-                return draw_colored_bounding_boxes(cv2_image, result_json)
-            else:
-                print("No valid JSON found in response")
-                return cv2_image
-        except Exception as e:
-            print(f"Error processing response: {e}")
-            print(f"Response was: {result_text}")
-            return cv2_image
-            
+        # Crop around the detection in normalized coordinates, clamped to the frame
+        pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+        cx1, cy1 = max(0.0, x1 - pad_x), max(0.0, y1 - pad_y)
+        cx2, cy2 = min(1.0, x2 + pad_x), min(1.0, y2 + pad_y)
+        crop = cv2_image[int(cy1 * height):int(cy2 * height), int(cx1 * width):int(cx2 * width)]
+        if crop.size == 0:
+            continue
+        
+        color_name = obj["color"].lower()
+        if compact:
+            code = next((c for c, name in COLOR_CODES.items() if name == color_name), color_name)
+            refine_prompt = COMPACT_REFINE_PROMPT.format(color=color_name, code=code)
+        else:
+            refine_prompt = REFINE_PROMPT.format(color=color_name)
+        crop_json = detect_objects(resize_for_inference(crop, inference_size), refine_prompt, compact, token_usage)
+        refined += 1
+        if not crop_json:
+            continue
+        
+        matches = [o for o in crop_json.get("objects") or []
+                   if isinstance(o, dict) and str(o.get("color", "")).lower() == color_name
+                   and is_valid_bbox(o.get("bbox"))]
+        if not matches:
+            continue
+        
+        # Map the crop-relative bbox back to the full frame
+        rx1, ry1, rx2, ry2 = matches[0]["bbox"]
+        crop_w, crop_h = cx2 - cx1, cy2 - cy1
+        obj["bbox"] = [cx1 + rx1 * crop_w, cy1 + ry1 * crop_h, cx1 + rx2 * crop_w, cy1 + ry2 * crop_h]
+    
+    return result_json
+
+def segment_with_bounding_boxes(cv2_image, inference_size=None, refine=False, compact=False, token_usage=None):
+    """
+    Send a frame to Gemini to detect and segment red, blue, and yellow objects.
+    Returns the processed image with segmented objects and bounding boxes.
+    
+    Args:
+        cv2_image: Full resolution frame; boxes are drawn on this image
+        inference_size: If set, detect on a copy scaled so its longest side is at most this many pixels
+        refine: Run a second pass on full-resolution crops around small or uncertain detections
+        compact: Ask for the compact line format instead of JSON to cut completion tokens
+        token_usage: Optional dict accumulating "calls" and "completion_tokens" for this frame's calls
+    """
+    if compact:
+        prompt = COMPACT_DETECTION_PROMPT + COMPACT_CONFIDENCE_PROMPT if refine else COMPACT_DETECTION_PROMPT
+    else:
+        prompt = DETECTION_PROMPT + CONFIDENCE_PROMPT if refine else DETECTION_PROMPT
+    result_json = detect_objects(resize_for_inference(cv2_image, inference_size), prompt, compact, token_usage)
+    if result_json is None:
+        return cv2_image
+    
+    # A malformed reply should only skip this frame, not stop the video
+    try:
+        if refine:
+            result_json = refine_detections(cv2_image, result_json, inference_size, compact=compact,
+                                            token_usage=token_usage)
+        
+        # Draw bounding boxes on the full resolution image
+        return draw_colored_bounding_boxes(cv2_image, result_json)
     except Exception as e:
-        print(f"Error calling Gemini API: {e}")
+        print(f"Error processing response: {e}")
         return cv2_image
 
 def draw_colored_bounding_boxes(image, result_json):
@@ -205,7 +364,8 @@ def draw_colored_bounding_boxes(image, result_json):
     
     return output_image
 
-def process_video(input_path, output_path, method="bounding_boxes", target_fps=15, max_frames=100):
+def process_video(input_path, output_path, method="bounding_boxes", target_fps=15, max_frames=100, progress_callback=None,
+                  inference_size=None, refine=False, dry_run=False, compact=False):
     """
     Process a video by reducing frame rate and segmenting colored objects using Gemini.
     
@@ -215,7 +375,17 @@ def process_video(input_path, output_path, method="bounding_boxes", target_fps=1
         method: Processing method - "direct_image" or "bounding_boxes" (default)
         target_fps: Target frames per second (default: 15)
         max_frames: Maximum number of frames to process (default: 100)
+        progress_callback: Optional function called with the fraction of frames read (0 to 1)
+        inference_size: Longest side in pixels of the copy sent to the model (default: full resolution);
+            output is always written at the input resolution
+        refine: Refine small or uncertain detections on full-resolution crops (bounding_boxes only)
+        compact: Use the compact detection format instead of JSON (bounding_boxes only)
+        dry_run: Only estimate calls, upload bytes, tokens and wall time (see dry_run.py) and return them
     """
+    if dry_run:
+        from dry_run import plan_video
+        return plan_video(input_path, target_fps, max_frames, inference_size, refine and method != "direct_image")
+    
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
@@ -246,11 +416,14 @@ def process_video(input_path, output_path, method="bounding_boxes", target_fps=1
     
     print("Processing video frames...")
     
+    # Completion tokens of this run's detection calls, for comparing response formats
+    token_usage = {"calls": 0, "completion_tokens": 0}
+    
     # Select processing function based on method
     if method == "direct_image":
-        process_func = segment_with_direct_image
+        process_func = lambda frame: segment_with_direct_image(resize_for_inference(frame, inference_size))
     else:  # default to bounding_boxes
-        process_func = segment_with_bounding_boxes
+        process_func = lambda frame: segment_with_bounding_boxes(frame, inference_size, refine, compact, token_usage)
     
     while frame_count < max_frames:
         ret, frame = cap.read()
@@ -264,6 +437,10 @@ def process_video(input_path, output_path, method="bounding_boxes", target_fps=1
             # Process frame with selected method
             processed_frame = process_func(frame)
             
+            # The writer needs every frame at the input resolution
+            if processed_frame.shape[:2] != (height, width):
+                processed_frame = cv2.resize(processed_frame, (width, height))
+            
             # Write the frame to output video
             out.write(processed_frame)
             processed_count += 1
@@ -272,6 +449,9 @@ def process_video(input_path, output_path, method="bounding_boxes", target_fps=1
             time.sleep(0.5)
         
         frame_count += 1
+        
+        if progress_callback:
+            progress_callback(frame_count / max(1, min(max_frames, total_frames or max_frames)))
     
     # Release resources
     cap.release()
@@ -280,6 +460,8 @@ def process_video(input_path, output_path, method="bounding_boxes", target_fps=1
     print(f"Video processing complete. Output saved to: {output_path}")
     print(f"Processed frames: {processed_count} out of {frame_count} frames")
     print(f"Target FPS: {target_fps}, Actual FPS: {original_fps/frame_sampling_rate:.2f}")
+    if token_usage["calls"]:
+        print(f"Average completion tokens per detection call: {token_usage['completion_tokens'] / token_usage['calls']:.1f}")
 
 if __name__ == "__main__":
     input_video = "video_2.mp4"
@@ -5,12 +5,10 @@ import re
 import time
 import cv2
 import numpy as np
-from openai import OpenAI
+from llm_client import get_client
+from model_router import vision_router
 from PIL import Image
 
-# Initialize OpenAI client (using LiteLLM proxy)
-client = OpenAI(base_url="https://litellm.deriv.ai/v1", api_key=os.getenv('LITELLM_API_KEY'))
-
 def pil_to_cv2(pil_image):
     """Convert PIL image to OpenCV format (BGR)"""
     # Convert PIL image to RGB numpy array
@@ -58,8 +56,8 @@ def segment_colored_objects_with_gemini(cv2_image):
     
     # Create the message with the image
     try:
-        response = client.chat.completions.create(
-            model="gemini-2.0-flash-001",
+        response = vision_router.chat_completion(
+            get_client(),
             messages=[
                 {
                     "role": "user",